@@ -1,4 +1,6 @@
 import curses
+import curses.panel
+import os
 import re
 
 
@@ -6,8 +8,11 @@ class BaseBox:
     """
     A base class for all boxes, extends to input and select
     Meant to be built off of, not used by itself
+    Boxes live on their own curses panel, so the screen underneath is never touched
     """
 
+    frames = {}  # (height, width, title, title row) -> frame lines, built once per size
+
     def __init__(self, height: int, width: int, title: str) -> None:
         self.height = height
         self.width = width
@@ -22,20 +27,33 @@ class BaseBox:
         self.content = []
         self.parsed_content = {}
         self.active_screen = None
+        self.window = None
+        self.panel = None
         self._instantiate_box()
 
     def _instantiate_box(self) -> None:
         """
         Sets the content to match arguments
+        Reuses the frame from an earlier box of the same size if there is one
+        """
+        key = (self.height, self.width, self.title, self._title_row())
+        if key not in BaseBox.frames:
+            self._draw_border()
+            self._draw_title()
+            BaseBox.frames[key] = tuple(self.content)
+        self.content = list(BaseBox.frames[key])
+
+    def _title_row(self) -> int:
+        """
+        The title sits about 1/3 down the box
         """
-        self._draw_border()
-        self._draw_title()
+        return self.height // 3
 
     def _draw_title(self) -> None:
         """
         Draws the title about 1/3 down the screen
         """
-        self.content[self.height // 3] = "|" + self.title.center(self.width - 2) + "|"
+        self.content[self._title_row()] = "|" + self.title.center(self.width - 2) + "|"
 
     def _draw_border(self) -> None:
         """
@@ -55,23 +73,61 @@ class BaseBox:
         self.y = y if y is not None else self.y
         self.active_screen = scr
 
-        for i, line in enumerate(self.content):
-            try:
-                parsed = self.parsed_content[i]
-                for index, char in enumerate(line):
-                    scr.addch(self.y + i, self.x + index, char, parsed[index])
-            except:
-                scr.addstr(self.y + i, self.x, line)
+        self._place()
+        for i in range(len(self.content)):
+            self._draw_row(i)
+
+    def _place(self) -> None:
+        """
+        Creates the panel on first draw, moves and shows it after that
+        """
+        if self.window is None:
+            self.window = curses.newwin(self.height, self.width, self.y, self.x)
+            self.panel = curses.panel.new_panel(self.window)
+        else:
+            if self.window.getbegyx() != (self.y, self.x):
+                self.panel.move(self.y, self.x)
+            if self.panel.hidden():
+                self.panel.show()
+
+    def _draw_row(self, i: int) -> None:
+        """
+        Writes line i of self.content into the box window
+        Colors from self.parsed_content are written as runs, not per character
+        """
+        line = self.content[i]
+        parsed = self.parsed_content.get(i)
+        try:
+            if parsed is None:
+                self.window.addstr(i, 0, line)
+                return
+            start = 0
+            for index in range(1, len(line) + 1):
+                if index == len(line) or parsed[index] != parsed[start]:
+                    self.window.addstr(i, start, line[start:index], parsed[start])
+                    start = index
+        except curses.error:  # Bottom right corner pushes the cursor off the window
+            pass
+
+    def hide(self) -> None:
+        """
+        Takes the box off the screen
+        Whatever was underneath is shown again, without being redrawn
+        """
+        if self.panel is not None and not self.panel.hidden():
+            self.panel.hide()
+            curses.panel.update_panels()
+            curses.doupdate()
 
     def move_cursor(self, y: int, x: int, scr=None) -> None:
         """
         Moves cursor to y, x
         Useful for stickying cursor
+        Also pushes any changed panels to the terminal in one update
         """
-        scr = scr or self.active_screen
-        scr.move(y, x)
+        curses.panel.update_panels()
         curses.setsyx(y, x)
-        scr.refresh()
+        curses.doupdate()
 
 
 class SelectBox(BaseBox):
@@ -84,20 +140,18 @@ class SelectBox(BaseBox):
         super().__init__(height, width, title)
         self.options = options
         self.active_option = 0
+        self.return_cursor = (0, 0)
 
     def draw(self, scr=None, y: int = None, x: int = None) -> None:
         """
         Draws the SelectBox on given screen, or last used screen
         """
         scr = scr or self.active_screen
-        cur_y, cur_x = scr.getyx()
-        self.x = x if x is not None else self.x
-        self.y = y if y is not None else self.y
-        self.active_screen = scr
+        self.return_cursor = scr.getyx()
 
         self._draw_options()
         super().draw(scr=scr, y=y, x=x)
-        super().move_cursor(cur_y, cur_x)
+        super().move_cursor(*self.return_cursor)
 
     def _draw_options(self) -> None:
         """
@@ -145,7 +199,62 @@ class SelectBox(BaseBox):
             case 10:  # Enter
                 return self.active_option
         self._draw_options()
-        self.draw()
+        self._draw_row((self.height // 3) * 2)
+        self.move_cursor(*self.return_cursor)
+
+
+class CompletionBox(SelectBox):
+    """
+    A SelectBox for word completion, one option per row, meant to sit under the cursor
+    Enter or tab returns the chosen option. Any other key returns False,
+    so the editor can close the box and handle the key itself
+    """
+
+    def __init__(self, options: list, prefix: str) -> None:
+        self.prefix = prefix  # The part of the word already typed
+        width = max(len(option) for option in options) + 4
+        super().__init__(len(options) + 2, width, "", options)
+
+    def _title_row(self) -> int:
+        return 0
+
+    def _draw_title(self) -> None:
+        pass  # No room for a title, the top border stays
+
+    def _draw_options(self) -> None:
+        """
+        Writes one option per row, highlighting the active one
+        """
+        inner = self.width - 2
+        for i, option in enumerate(self.options):
+            self.content[i + 1] = "|" + (" " + option).ljust(inner) + "|"
+            if i == self.active_option:
+                self.parsed_content[i + 1] = (
+                    [curses.color_pair(0)]
+                    + [curses.color_pair(1)] * inner
+                    + [curses.color_pair(0)]
+                )
+            else:
+                self.parsed_content.pop(i + 1, None)
+
+    def handle_input(self, inp: int):
+        """
+        Up and down change the active option
+        """
+        match inp:
+            case 258:  # Down
+                self.active_option = min(self.active_option + 1, len(self.options) - 1)
+            case 259:  # Up
+                self.active_option = max(self.active_option - 1, 0)
+            case 9 | 10:  # Tab or enter
+                return self.options[self.active_option]
+            case _:
+                return False
+        self._draw_options()
+        for i in range(len(self.options)):
+            self._draw_row(i + 1)
+        self.move_cursor(*self.return_cursor)
+        return None
 
 
 class InputBox(BaseBox):
@@ -162,22 +271,28 @@ class InputBox(BaseBox):
         super().__init__(height, width, title)
 
     def draw(self, scr=None, y: int = None, x: int = None) -> None:
-        scr = scr or self.active_screen
-        cur_y, cur_x = scr.getyx()
-        self.x = x if x is not None else self.x
-        self.y = y if y is not None else self.y
-        self.active_screen = scr
-
         self._draw_inputbox()
         self.input_start = self._get_input_start()
         super().draw(scr=scr, y=y, x=x)
+        self._move_to_input()
+
+    def _move_to_input(self) -> None:
+        """
+        Puts the cursor where the next typed character will go
+        """
         super().move_cursor(
-            self.y + ((self.height // 3) * 2),
+            self.y + self._input_row(),
             self.x + self.input_start + self.cursor_position,
         )
 
+    def _input_row(self) -> int:
+        """
+        The input line sits about 2/3 down the box
+        """
+        return (self.height // 3) * 2
+
     def _get_input_start(self) -> int:
-        for i, char in enumerate(self.content[(self.height // 3) * 2]):
+        for i, char in enumerate(self.content[self._input_row()]):
             if char != "|" and char != " ":
                 return i
         return -1
@@ -200,7 +315,7 @@ class InputBox(BaseBox):
                     + "|"
                 )
 
-        self.content[(self.height // 3) * 2] = line
+        self.content[self._input_row()] = line
 
     def handle_input(self, inp: int) -> str:
         match inp:
@@ -249,7 +364,9 @@ class InputBox(BaseBox):
         if self.cursor_position > self.width // 2:
             self.cursor_position = self.width // 2
         self._draw_inputbox()
-        self.draw()
+        self.input_start = self._get_input_start()
+        self._draw_row(self._input_row())
+        self._move_to_input()
 
 
 class SaveBox(SelectBox):
@@ -278,3 +395,99 @@ class SaveBox(SelectBox):
         elif res == 1:
             return False
         return None
+
+
+class FileBox(InputBox):
+    """
+    An InputBox with a ranked list of matches under the input
+    Ranking is done by finder a slice at a time (see FileIndex.FuzzyQuery),
+    so tick is called while the user isn't typing until it's finished
+    Nothing is selected until the user moves down, until then enter
+    takes the typed text as it is
+    """
+
+    def __init__(self, height: int, width: int, title: str, finder) -> None:
+        self.finder = finder
+        self.selected = -1  # -1 is the typed text, not one of the matches
+        super().__init__(height, width, title)
+        self.finder.limit = max(1, self.height - 1 - self._results_start())
+
+    @property
+    def busy(self) -> bool:
+        return not self.finder.finished
+
+    def _title_row(self) -> int:
+        return 1
+
+    def _input_row(self) -> int:
+        return 2
+
+    def _results_start(self) -> int:
+        return 4
+
+    def draw(self, scr=None, y: int = None, x: int = None) -> None:
+        self.finder.update(self.text)
+        self.finder.step()
+        self._fill_results()
+        super().draw(scr=scr, y=y, x=x)
+
+    def _fill_results(self) -> None:
+        """
+        Writes the current matches into self.content, highlighting the selected one
+        """
+        results = self.finder.results
+        self.selected = min(self.selected, len(results) - 1)
+        inner = self.width - 2
+        for i in range(self.finder.limit):
+            row = self._results_start() + i
+            path = results[i] if i < len(results) else ""
+            if len(path) > inner - 2:  # Keep the end of long paths, it's the filename
+                path = "..." + path[-(inner - 5) :]
+            self.content[row] = "|" + (" " + path).ljust(inner) + "|"
+            if path and i == self.selected:
+                self.parsed_content[row] = (
+                    [curses.color_pair(0)]
+                    + [curses.color_pair(1)] * inner
+                    + [curses.color_pair(0)]
+                )
+            else:
+                self.parsed_content.pop(row, None)
+
+    def _draw_results(self) -> None:
+        self._fill_results()
+        for i in range(self.finder.limit):
+            self._draw_row(self._results_start() + i)
+        self._move_to_input()
+
+    def tick(self) -> None:
+        """
+        Called when there's no input, keeps ranking where it left off
+        """
+        if self.finder.step():
+            self._draw_results()
+
+    def handle_input(self, inp: int) -> str:
+        """
+        Up and down pick a match, enter returns it
+        Enter returns the typed text if no match was picked, or if it's a path
+        that already exists, so new and unindexed files can still be opened
+        """
+        match inp:
+            case 258:  # Down
+                self.selected += 1
+                self._draw_results()
+                return None
+            case 259:  # Up
+                self.selected = max(-1, self.selected - 1)
+                self._draw_results()
+                return None
+            case 10:  # Enter
+                if self.selected < 0 or os.path.exists(self.text):
+                    return self.text
+                return self.finder.results[self.selected]
+        super().handle_input(inp)
+        self.finder.update(self.text)
+        self.selected = -1
+        self.finder.step()
+        self._draw_results()
+        return None
@@ -0,0 +1,238 @@
+import difflib
+from array import array
+from bisect import bisect_left, bisect_right
+
+ADDED = "+"
+MODIFIED = "~"
+DELETED = "_"
+CONTEXT = 3  # Lines around an edit that are re-diffed with it
+
+
+def _uneven(hunk: list) -> bool:
+    return hunk[1] - hunk[0] != 1 or hunk[3] - hunk[2] != 1
+
+
+def _spare(hunk: list) -> int:
+    """
+    Saved lines a hunk has beyond its buffer lines, what a deletion leaves
+    """
+    return max(0, (hunk[3] - hunk[2]) - (hunk[1] - hunk[0]))
+
+
+def _join(hunks: list) -> list:
+    """
+    Joins hunks with nothing unchanged between them, so a run of edits stays
+    one hunk. Line for line hunks are left alone for LineDiff._changed_line
+    """
+    joined = []
+    for hunk in hunks:
+        last = joined[-1] if joined else None
+        if last and last[1] == hunk[0] and (_uneven(last) or _uneven(hunk)):
+            last[1], last[3] = hunk[1], hunk[3]
+        else:
+            joined.append(hunk)
+    return joined
+
+
+class LineDiff:
+    """
+    Differences between the buffer and the file as it was saved
+    The saved file is kept as one hash per line, not a second copy of the text
+    Hunks are [start, end, saved start, saved end] with buffer lines start:end
+    standing in for saved lines saved start:saved end. Anything between hunks
+    is unchanged, so an edit only needs to re-diff the lines around it.
+    How a hunk's lines pair up inside it doesn't matter, so a hunk reaching
+    past those lines is split where they end, and only its inside re-diffed
+    """
+
+    def __init__(self) -> None:
+        self.saved = array("q")
+        self.hunks = []
+        self.uneven = 0  # Hunks that aren't a single line for a single line
+
+    @property
+    def modified(self) -> bool:
+        return bool(self.hunks)
+
+    def reset(self, lines: list) -> None:
+        """
+        Makes lines the saved state, e.g. after loading or saving
+        """
+        self.saved = array("q", map(hash, lines))
+        self.hunks = []
+        self.uneven = 0
+
+    def _saved_line(self, line: int, before: int) -> int:
+        """
+        Saved line number for an unchanged buffer line, given the index of the
+        first hunk after it
+        """
+        if before == 0:
+            return line
+        hunk = self.hunks[before - 1]
+        return hunk[3] + (line - hunk[1])
+
+    def changed(self, start: int, removed: int, added: int, lines: list) -> None:
+        """
+        Called after lines[start:start + removed] was replaced by added lines
+        Re-diffs the edited lines and CONTEXT lines either side of them, so
+        hunks that cancel each other out (like a line added then one deleted)
+        merge, however big the hunk they're in
+        """
+        hunks = self.hunks
+        if removed == added == 1 and self._changed_line(start, lines[start]):
+            if hunks:
+                self._verify(lines)
+            return
+        shift = added - removed
+        first = max(0, start - CONTEXT)  # Buffer lines, before the edit
+        last = min(len(lines) - shift, start + removed + CONTEXT)
+
+        # Hunks overlapping first:last, or touching it with deleted lines to offer
+        lo = bisect_left(hunks, first, key=lambda hunk: hunk[1])
+        while lo < len(hunks) and hunks[lo][1] == first and not _spare(hunks[lo]):
+            lo += 1
+        hi = lo
+        while hi < len(hunks) and (
+            hunks[hi][0] < last or hunks[hi][0] == last and _spare(hunks[hi])
+        ):
+            hi += 1
+
+        # Hunks reaching out of first:last keep their lines outside of it,
+        # along with all but CONTEXT of their spare saved lines
+        before = after = None
+        saved_first = self._saved_line(first, lo)
+        if lo < hi and hunks[lo][0] <= first:
+            hunk = hunks[lo]
+            spare = min(CONTEXT, _spare(hunk))
+            saved_first = max(hunk[2], hunk[3] - (hunk[1] - first) - spare)
+            if hunk[0] < first or hunk[2] < saved_first:
+                before = [hunk[0], first, hunk[2], saved_first]
+        saved_last = self._saved_line(last, hi)
+        if lo < hi and hunks[hi - 1][1] >= last:
+            hunk = hunks[hi - 1]
+            spare = min(CONTEXT, _spare(hunk))
+            inside = saved_first if hunk[0] <= first else hunk[2]
+            saved_last = min(hunk[3], inside + last - max(hunk[0], first) + spare)
+            if hunk[1] > last or saved_last < hunk[3]:
+                after = [last + shift, hunk[1] + shift, saved_last, hunk[3]]
+
+        current = [hash(lines[i]) for i in range(first, last + shift)]
+        matcher = difflib.SequenceMatcher(
+            None, current, self.saved[saved_first:saved_last], autojunk=False
+        )
+        new = []
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                continue
+            if tag == "replace" and i2 - i1 == j2 - j1:
+                # One hunk per line, so later edits only touch the line they're on
+                for k in range(i2 - i1):
+                    line, saved = first + i1 + k, saved_first + j1 + k
+                    new.append([line, line + 1, saved, saved + 1])
+            else:
+                new.append(
+                    [first + i1, first + i2, saved_first + j1, saved_first + j2]
+                )
+
+        if before:
+            new.insert(0, before)
+        if after:
+            new.append(after)
+
+        if shift:
+            for hunk in hunks[hi:]:
+                hunk[0] += shift
+                hunk[1] += shift
+        left, right = hunks[lo - 1 : lo] if lo else [], hunks[hi : hi + 1]
+        old = sum(map(_uneven, left + hunks[lo:hi] + right))
+        new = _join(left + new + right)  # The neighbours may join up too
+        self.uneven += sum(map(_uneven, new)) - old
+        hunks[lo - len(left) : hi + len(right)] = new
+        if hunks:
+            self._verify(lines)
+
+    def _verify(self, lines: list) -> None:
+        """
+        Drops every hunk if the buffer turns out to match the saved file anyway
+        Hunks far enough apart to be diffed separately can still cancel out,
+        but only if some aren't line for line and the line counts add up
+        """
+        hunks = self.hunks
+        if not self.uneven or len(lines) != len(self.saved):
+            return
+        first, last = hunks[0][0], hunks[-1][1]
+        if all(hash(lines[i]) == self.saved[i] for i in range(first, last)):
+            hunks.clear()
+            self.uneven = 0
+
+    def _changed_line(self, line: int, text: str) -> bool:
+        """
+        Fast path for typing on a single line, which is either unchanged or
+        a line for line replacement. Returns False if it needs a real diff,
+        which is also the case next to a hunk the line might merge into
+        """
+        hunks = self.hunks
+        i = bisect_left(hunks, line + 1, key=lambda hunk: hunk[1])
+        after = i + 1 if i < len(hunks) and hunks[i][0] <= line else i
+        if i and _uneven(hunks[i - 1]) and hunks[i - 1][1] >= line - CONTEXT:
+            return False
+        if after < len(hunks) and _uneven(hunks[after]):
+            if hunks[after][0] <= line + 1 + CONTEXT:
+                return False
+        if i == len(hunks) or hunks[i][0] > line:  # Line matched the saved file
+            saved = self._saved_line(line, i)
+            if hash(text) != self.saved[saved]:
+                hunks.insert(i, [line, line + 1, saved, saved + 1])
+            return True
+        start, end, saved_start, saved_end = hunks[i]
+        if start == line and end == line + 1 and saved_end == saved_start + 1:
+            if hash(text) == self.saved[saved_start]:  # Typed back to how it was
+                del hunks[i]
+            return True
+        return False
+
+    def appended(self, start: int, lines: list) -> None:
+        """
+        Called when lines[start:] were appended to the saved file as well,
+        like a followed file growing. Becomes an edit if the end was changed
+        """
+        if self.hunks and self.hunks[-1][1] >= start:
+            self.changed(start, 1, len(lines) - start, lines)
+            return
+        saved_start = self._saved_line(start, len(self.hunks))
+        self.saved[saved_start:] = array("q", (hash(line) for line in lines[start:]))
+
+    def marks(self, first: int, last: int, length: int) -> dict:
+        """
+        Returns line -> ADDED, MODIFIED or DELETED for lines first:last
+        Deletions are marked on the line after them (the last line at the end)
+        """
+        marks = {}
+        i = bisect_right(self.hunks, first, key=lambda hunk: hunk[1])
+        if i > 0 and self.hunks[i - 1][0] == self.hunks[i - 1][1] == first:
+            i -= 1  # Deletion right above first
+        for start, end, saved_start, saved_end in self.hunks[i:]:
+            if start > last:
+                break
+            if start == end:
+                marks.setdefault(min(start, length - 1), DELETED)
+                continue
+            kind = ADDED if saved_start == saved_end else MODIFIED
+            for line in range(max(start, first), min(end, last)):
+                marks[line] = kind
+        return marks
+
+    def next_change(self, line: int) -> int:
+        """
+        First line of the next hunk after line, or None
+        """
+        i = bisect_right(self.hunks, line, key=lambda hunk: hunk[0])
+        return self.hunks[i][0] if i < len(self.hunks) else None
+
+    def prev_change(self, line: int) -> int:
+        """
+        First line of the closest hunk starting before line, or None
+        """
+        i = bisect_left(self.hunks, line, key=lambda hunk: hunk[0])
+        return self.hunks[i - 1][0] if i > 0 else None
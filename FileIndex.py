@@ -0,0 +1,328 @@
+import heapq
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+# One entry per walked directory, reused on refresh while its mtimes are unchanged
+DirEntry = namedtuple(
+    "DirEntry", ["mtime", "ignore_mtime", "parent_rules", "rules", "subdirs", "files"]
+)
+
+
+def translate(pattern: str) -> str:
+    """
+    Turns a .gitignore glob into a regex. Unlike fnmatch, * and ? never match
+    a /, only ** crosses directories (and a/**/b matches a/b too)
+    """
+    parts, i = [], 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("/**/", i):
+            parts.append("(?:/.*)?/")
+            i += 4
+            continue
+        if pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+            continue
+        end = pattern.find("]", i + 2) if char == "[" else -1
+        if char == "*":
+            parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        elif end != -1:  # Character class, ! negates it like ^ does
+            body = pattern[i + 1 : end].replace("\\", "\\\\")
+            parts.append("[" + ("^" + body[1:] if body[0] == "!" else body) + "]")
+            i = end
+        elif char == "\\" and i + 1 < len(pattern):  # Escaped, taken literally
+            i += 1
+            parts.append(re.escape(pattern[i]))
+        else:
+            parts.append(re.escape(char))
+        i += 1
+    return "(?s:" + "".join(parts) + r")\Z"
+
+
+class GitIgnore:
+    """
+    The rules from a single .gitignore file
+    Patterns are compiled once, matching is done against paths relative to the root
+    """
+
+    def __init__(self, base: str, lines: list) -> None:
+        self.base = base  # Directory of the .gitignore, relative to the root
+        self.rules = []  # (regex, negate, dir_only, anchored)
+        for line in lines:
+            line = line.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            line = line[1:] if negate else line
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            anchored = "/" in line
+            line = line.lstrip("/")
+            if line.startswith("**/"):  # Matches at any depth, same as unanchored
+                line, anchored = line[3:], "/" in line[3:]
+            if line:
+                regex = re.compile(translate(line))
+                self.rules.append((regex, negate, dir_only, anchored))
+
+    @classmethod
+    def load(cls, base: str, path: str):
+        """
+        Reads the .gitignore at path, returns None if there isn't one
+        """
+        try:
+            with open(path) as f:
+                return cls(base, f.readlines())
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    def match(self, path: str, is_dir: bool) -> bool:
+        """
+        Returns True (ignored), False (explicitly kept) or None (no rule applies)
+        """
+        if self.base:
+            if not path.startswith(self.base + "/"):
+                return None
+            path = path[len(self.base) + 1 :]
+        name = path.rsplit("/", 1)[-1]
+        for regex, negate, dir_only, anchored in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(path if anchored else name):
+                return not negate
+        return None
+
+
+def is_ignored(rules: tuple, path: str, is_dir: bool) -> bool:
+    """
+    Checks path against every .gitignore above it, the deepest file wins
+    """
+    for ignore in reversed(rules):
+        res = ignore.match(path, is_dir)
+        if res is not None:
+            return res
+    return False
+
+
+class FileIndex:
+    """
+    An in-memory list of every file under root, built by a background thread
+    Refreshing only re-lists directories whose mtime has changed
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = os.path.abspath(root)
+        self.paths = []  # Relative file paths, appended to while the first walk runs
+        self.version = 0  # Bumped whenever self.paths is swapped for a new list
+        self.building = False
+        self._dirs = {}  # Relative directory -> DirEntry
+        self._thread = None
+
+    def refresh(self) -> None:
+        """
+        Starts a walk in the background, unless one is already running
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self.building = True
+        self._thread = threading.Thread(target=self._walk, daemon=True)
+        self._thread.start()
+
+    def _walk(self) -> None:
+        """
+        Walks the tree, reusing the listing of any directory that hasn't changed
+        The first walk streams straight into self.paths, so results show up early
+        """
+        try:
+            first = not self._dirs
+            paths = self.paths if first else []
+            dirs = {}
+            stack = [("", ())]
+            while stack:
+                rel, parent_rules = stack.pop()
+                entry = self._get_dir(rel, parent_rules)
+                if entry is None:
+                    continue
+                dirs[rel] = entry
+                paths.extend(entry.files)
+                for sub in reversed(entry.subdirs):
+                    stack.append((sub, entry.rules))
+            self._dirs = dirs
+            if not first:
+                self.paths = paths
+                self.version += 1
+        finally:
+            self.building = False
+
+    def _get_dir(self, rel: str, parent_rules: tuple) -> DirEntry:
+        """
+        Returns the cached listing of rel, or lists it again if it has changed
+        """
+        full = os.path.join(self.root, rel)
+        try:
+            mtime = os.stat(full).st_mtime_ns
+        except OSError:
+            return None
+        try:
+            ignore_mtime = os.stat(os.path.join(full, ".gitignore")).st_mtime_ns
+        except OSError:
+            ignore_mtime = None
+
+        cached = self._dirs.get(rel)
+        rules = None
+        if (
+            cached is not None
+            and cached.ignore_mtime == ignore_mtime
+            and cached.parent_rules is parent_rules  # Parent's ignores unchanged
+        ):
+            if cached.mtime == mtime:
+                return cached
+            rules = cached.rules  # Kept, so subdirectories still match their cache
+        return self._scan(rel, full, parent_rules, mtime, ignore_mtime, rules)
+
+    def _scan(
+        self,
+        rel: str,
+        full: str,
+        parent_rules: tuple,
+        mtime: int,
+        ignore_mtime: int,
+        rules: tuple = None,
+    ) -> DirEntry:
+        """
+        Lists a single directory, dropping anything .gitignore excludes
+        rules are the ignores for its contents if they're known, else they're loaded
+        """
+        if rules is None:
+            rules = parent_rules
+            if ignore_mtime is not None:
+                ignore = GitIgnore.load(rel, os.path.join(full, ".gitignore"))
+                if ignore is not None:
+                    rules = parent_rules + (ignore,)
+
+        subdirs, files = [], []
+        try:
+            entries = sorted(os.scandir(full), key=lambda e: e.name)
+        except OSError:
+            entries = []
+        for entry in entries:
+            if entry.name == ".git":
+                continue
+            path = rel + "/" + entry.name if rel else entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_ignored(rules, path, is_dir):
+                continue
+            (subdirs if is_dir else files).append(path)
+        return DirEntry(mtime, ignore_mtime, parent_rules, rules, subdirs, files)
+
+
+def fuzzy_score(query: str, path: str) -> int:
+    """
+    Scores path against a lowercase query, None if the query isn't a subsequence
+    Consecutive characters, word starts and the filename itself score higher
+    """
+    lower = path.lower()
+    name_start = lower.rfind("/") + 1
+    score, pos, prev = 0, -1, -2
+    for char in query:
+        pos = lower.find(char, pos + 1)
+        if pos == -1:
+            return None
+        if pos == prev + 1:
+            score += 5
+        if pos == 0 or lower[pos - 1] in "/_-. ":
+            score += 3
+        if pos >= name_start:
+            score += 2
+        prev = pos
+    return score * 256 - min(len(path), 255)  # Shorter paths win ties
+
+
+class FuzzyQuery:
+    """
+    Ranks the paths of a FileIndex against a query, a slice of work at a time
+    Typing more of the same query only rescans the paths that matched before
+    """
+
+    def __init__(self, index: FileIndex, limit: int) -> None:
+        self.index = index
+        self.limit = limit
+        self.query = ""
+        self.results = []  # Best matches so far, best first
+        self._version = index.version
+        self._candidates = index.paths
+        self._matched = []  # Every path matching self.query, for narrowing
+        self._position = 0
+        self._heap = []
+        self._complete = False  # Scanned every candidate for self.query
+
+    @property
+    def finished(self) -> bool:
+        return self._complete
+
+    def update(self, query: str) -> None:
+        """
+        Starts ranking a new query
+        """
+        query = query.lower()
+        if query == self.query and self._version == self.index.version:
+            return
+        narrowing = (
+            self._complete
+            and query.startswith(self.query)
+            and self._version == self.index.version
+        )
+        self.query = query
+        # Only paths that matched the shorter query can match a longer one
+        self._restart(self._matched if narrowing else self.index.paths)
+
+    def _restart(self, candidates: list) -> None:
+        self._version = self.index.version
+        self._candidates = candidates
+        self._matched = []
+        self._position = 0
+        self._heap = []
+        self._complete = False
+
+    def step(self, budget: float = 0.01) -> bool:
+        """
+        Scores candidates until budget seconds have passed
+        Returns True if self.results changed
+        """
+        if self._version != self.index.version:  # Index was refreshed underneath us
+            self._restart(self.index.paths)
+        deadline = time.perf_counter() + budget
+        candidates, heap, query = self._candidates, self._heap, self.query
+        start = self._position
+        while self._position < len(candidates):
+            stop = min(self._position + 512, len(candidates))
+            for i in range(self._position, stop):
+                path = candidates[i]
+                score = fuzzy_score(query, path)
+                if score is None:
+                    continue
+                self._matched.append(path)
+                if len(heap) < self.limit:
+                    heapq.heappush(heap, (score, path))
+                elif score > heap[0][0]:
+                    heapq.heapreplace(heap, (score, path))
+            self._position = stop
+            if time.perf_counter() > deadline:
+                break
+
+        if self._position >= len(candidates) and (
+            candidates is not self.index.paths or not self.index.building
+        ):
+            self._complete = True
+        if self._position == start and self._position:
+            return False
+        self.results = [path for _, path in sorted(heap, reverse=True)]
+        return True
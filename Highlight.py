@@ -0,0 +1,78 @@
+import re
+import sys
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+
+_RUNS = re.compile(rb"(.)\1*", re.DOTALL)
+ENTRY = 96  # Rough bytes the OrderedDict spends per entry, on its table and links
+
+
+def compress(colors: bytearray) -> array:
+    """
+    Packs one color pair number per character into run-length spans
+    The array holds every run's end index, then every run's color pair,
+    so the ends can be binary searched in place
+    """
+    spans = array("I")
+    pairs = array("I")
+    for match in _RUNS.finditer(colors):
+        spans.append(match.end())
+        pairs.append(colors[match.start()])
+    spans.extend(pairs)
+    return spans
+
+
+def runs(spans: array, start: int, stop: int):
+    """
+    Yields (start, end, color pair) for each run overlapping start:stop, clipped to it
+    """
+    count = len(spans) // 2
+    i = bisect_right(spans, start, 0, count)
+    while i < count and start < stop:
+        end = min(spans[i], stop)
+        yield start, end, spans[count + i]
+        start = end
+        i += 1
+
+
+class HighlightCache:
+    """
+    Highlight spans keyed by line text, so edits and inserted lines never
+    leave stale entries behind. Least recently used lines are dropped once
+    the spans take up more than budget bytes
+    """
+
+    def __init__(self, budget: int) -> None:
+        self.budget = budget
+        self.used = 0  # Bytes held by the cached spans and their entries
+        self._spans = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+    def get(self, line: str) -> array:
+        spans = self._spans.get(line)
+        if spans is not None:
+            self._spans.move_to_end(line)
+        return spans
+
+    def peek(self, line: str) -> array:
+        """
+        Like get, but doesn't count as a use, for reading the whole file
+        """
+        return self._spans.get(line)
+
+    def put(self, line: str, spans: array) -> None:
+        old = self._spans.pop(line, None)
+        if old is not None:
+            self.used -= sys.getsizeof(old) + ENTRY
+        self._spans[line] = spans
+        self.used += sys.getsizeof(spans) + ENTRY
+        while self.used > self.budget and len(self._spans) > 1:
+            _, dropped = self._spans.popitem(last=False)
+            self.used -= sys.getsizeof(dropped) + ENTRY
+
+    def clear(self) -> None:
+        self._spans.clear()
+        self.used = 0
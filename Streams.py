@@ -0,0 +1,70 @@
+import codecs
+import os
+
+
+class StreamReader:
+    """
+    Reads text from a pipe, or from a file that keeps growing, without blocking
+    Only bytes past what has already been read are ever touched
+    """
+
+    def __init__(self, fd: int, is_file: bool = False) -> None:
+        self.fd = fd
+        self.is_file = is_file  # Regular files are polled by size, pipes by read
+        self.offset = 0
+        self.closed = False
+        self.truncated = False  # Set when a followed file shrinks (log rotation)
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        if not is_file:
+            os.set_blocking(fd, False)
+
+    @classmethod
+    def follow(cls, path: str):
+        """
+        Opens path to be read as it grows, like tail -f
+        """
+        return cls(os.open(path, os.O_RDONLY), is_file=True)
+
+    def read(self, limit: int = None) -> str:
+        """
+        Returns whatever text has arrived since the last read, "" if nothing has
+        limit caps how many bytes are read, so a fast pipe can't stall the editor
+        """
+        if self.closed:
+            return ""
+        if self.is_file:
+            size = os.fstat(self.fd).st_size
+            if size < self.offset:  # Truncated, start again from the top
+                self.offset = 0
+                self.truncated = True
+                self._decoder.reset()
+            count = size - self.offset
+            if limit is not None:
+                count = min(limit, count)
+            if count <= 0:
+                return ""
+            data = os.pread(self.fd, count, self.offset)
+        else:
+            try:
+                data = os.read(self.fd, limit or 1 << 20)
+            except BlockingIOError:  # Nothing in the pipe yet
+                return ""
+            if not data:  # Writer closed the pipe
+                self.close()
+                return self._decoder.decode(b"", final=True)
+        self.offset += len(data)
+        return self._decoder.decode(data)
+
+    def skip_to_end(self) -> None:
+        """
+        Moves past everything in a followed file so far, without reading it
+        For text the editor wrote there itself, which it already has
+        """
+        if self.is_file and not self.closed:
+            self.offset = os.fstat(self.fd).st_size
+            self._decoder.reset()
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            os.close(self.fd)
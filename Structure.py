@@ -0,0 +1,136 @@
+import re
+from array import array
+
+# Comments and strings are matched so the brackets inside them are skipped
+_TOKENS = re.compile(r"""#.*|"(?:\\.|[^"\\])*"?|'(?:\\.|[^'\\])*'?|[()\[\]{}]""")
+OPENERS = "([{"
+CLOSERS = ")]}"
+CHECKPOINT = 256  # Lines between saved copies of the open bracket stack
+
+
+def scan_line(line: str) -> tuple:
+    """
+    Returns (indent, brackets) for a single line
+    indent is -1 for blank and comment-only lines, which don't end a block
+    brackets is a tuple of (column, character) outside of strings and comments
+    """
+    stripped = line.lstrip()
+    indent = len(line) - len(stripped) if stripped and stripped[0] != "#" else -1
+    brackets = tuple(
+        (match.start(), match.group())
+        for match in _TOKENS.finditer(line)
+        if match.group() in OPENERS or match.group() in CLOSERS
+    )
+    return indent, brackets
+
+
+class StructureIndex:
+    """
+    Indentation and bracket positions for every line, kept up to date a line
+    at a time so folds and bracket matching never rescan the file
+    Brackets are paired up from the top as far as a match needs. An edit in
+    the paired lines only undoes the pairing back to the checkpoint above it
+    """
+
+    def __init__(self) -> None:
+        self.indents = array("i")
+        self.brackets = []
+        self._pairs = []  # Per paired line, column -> (line, column), or None
+        self._opened = []  # Brackets still open at the end of the paired lines
+        self._stacks = []  # Brackets open at the start of every CHECKPOINT-th line
+
+    def reset(self, lines: list) -> None:
+        self.indents = array("i")
+        self.brackets = []
+        self.update(0, 0, lines)
+
+    def update(self, start: int, removed: int, lines: list) -> None:
+        """
+        Replaces the entries for lines start:start + removed with the given lines
+        """
+        scanned = [scan_line(line) for line in lines]
+        self.indents[start : start + removed] = array("i", [s[0] for s in scanned])
+        self.brackets[start : start + removed] = [s[1] for s in scanned]
+        if start < len(self._pairs):
+            self._rewind(start)
+
+    def _rewind(self, line: int) -> None:
+        """
+        Undoes the pairing from the checkpoint at or above line onwards
+        """
+        checkpoint = line // CHECKPOINT
+        self._opened = list(self._stacks[checkpoint])
+        del self._stacks[checkpoint:], self._pairs[checkpoint * CHECKPOINT :]
+        for opened_line, column in self._opened:  # Their closers may have changed
+            self._pairs[opened_line].pop(column, None)
+
+    def fold_end(self, line: int) -> int:
+        """
+        Returns the last line of the region that line opens, or None
+        That's the block indented under it, or failing that, everything up to
+        the line that closes a bracket left open at the end of it
+        """
+        indent = self.indents[line]
+        if indent < 0:
+            return None
+        end, i = line, line + 1
+        while i < len(self.indents) and (
+            self.indents[i] < 0 or self.indents[i] > indent
+        ):
+            if self.indents[i] >= 0:
+                end = i
+            i += 1
+        if end > line:
+            return end
+
+        opened = []
+        for column, char in self.brackets[line]:
+            if char in OPENERS:
+                opened.append(column)
+            elif opened:
+                opened.pop()
+        if opened:
+            match = self.match_bracket(line, opened[-1])
+            if match is not None and match[0] > line + 1:
+                return match[0] - 1  # Leave the closing line showing
+        return None
+
+    def match_bracket(self, line: int, column: int) -> tuple:
+        """
+        Returns the (line, column) of the bracket matching the one at line, column
+        None if there's no bracket there, or it's never closed
+        """
+        char = dict(self.brackets[line]).get(column)
+        if char is None:
+            return None
+        self._pair(line + 1)
+        if char in OPENERS:  # Its closer is somewhere below
+            while column not in self._pairs[line] and self._pair(len(self._pairs) + 1):
+                pass
+        return self._pairs[line].get(column)
+
+    def _pair(self, stop: int) -> bool:
+        """
+        Carries on pairing brackets up to line stop, or a little further
+        Any closer closes the last opener, whatever kind it is
+        Returns False if every line was paired already
+        """
+        pairs, opened, stacks = self._pairs, self._opened, self._stacks
+        line = len(pairs)
+        if line >= len(self.brackets):
+            return False
+        stop = min(max(stop, line + CHECKPOINT), len(self.brackets))
+        while line < stop:
+            if line % CHECKPOINT == 0:
+                stacks.append(tuple(opened))
+            tokens = self.brackets[line]
+            pairs.append({} if tokens else None)
+            for column, char in tokens:
+                if char in OPENERS:
+                    opened.append((line, column))
+                elif opened:
+                    start = opened.pop()
+                    pairs[start[0]][start[1]] = line, column
+                    pairs[line][column] = start
+            line += 1
+        return True
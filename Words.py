@@ -0,0 +1,141 @@
+import heapq
+import re
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+_WORDS = re.compile(r"\b[A-Za-z_]\w+")
+# What parse_line colors as comments and strings, each matched over the whole line
+_SKIP = [re.compile(case) for case in (r"#.*", r'"[^"]*"', r"'[^']*'")]
+SKIPPED_PAIR = 4  # Color pair parse_line gives comments and strings
+BLOCK = 512  # Words per block of the sorted word list, blocks split at twice this
+TOP = 16  # Most used words cached per block, completions beyond this scan it all
+
+
+def scan_words(line: str, spans=None) -> tuple:
+    """
+    Returns the identifiers in line, leaving out comments and strings
+    spans are the line's highlight spans if it's been parsed already,
+    otherwise the comments and strings are found again here
+    """
+    if spans is not None:
+        count = len(spans) // 2
+        return tuple(
+            match.group()
+            for match in _WORDS.finditer(line)
+            if spans[count + bisect_right(spans, match.start(), 0, count)]
+            != SKIPPED_PAIR
+        )
+    if "#" in line or '"' in line or "'" in line:
+        chars = list(line)
+        for pattern in _SKIP:
+            for match in pattern.finditer(line):
+                chars[match.start() : match.end()] = " " * len(match.group())
+        line = "".join(chars)
+    return tuple(_WORDS.findall(line))
+
+
+class WordIndex:
+    """
+    Every identifier in the file with how often it's used, for completion
+    Words are kept sorted in blocks, each caching its most used words, so a
+    short prefix matching most of the file only merges a few per block.
+    Each line's words are remembered, so a changed line only updates itself
+    """
+
+    def __init__(self) -> None:
+        self.lines = []  # Words on each line
+        self.counts = Counter()
+        self.blocks = [[]]  # Every word in counts, sorted, split into blocks
+        self.firsts = [""]  # First word of each block
+        self.tops = [[]]  # Most used words of each block, None once it's changed
+
+    def reset(self, lines: list, spans=None) -> None:
+        """
+        Indexes lines from scratch
+        spans is called with a line to get its cached highlight spans, or None
+        """
+        spans = spans or (lambda line: None)
+        self.lines = [scan_words(line, spans(line)) for line in lines]
+        self.counts = Counter()
+        for words in self.lines:
+            self.counts.update(words)
+        words = sorted(self.counts)
+        self.blocks = [words[i : i + BLOCK] for i in range(0, len(words), BLOCK)]
+        self.blocks = self.blocks or [[]]
+        self.firsts = [block[0] if block else "" for block in self.blocks]
+        self.tops = [self._top(block) for block in self.blocks]
+
+    def update(self, start: int, removed: int, lines: list, spans=None) -> None:
+        """
+        Replaces the words of lines start:start + removed with those in lines
+        """
+        spans = spans or (lambda line: None)
+        new = [scan_words(line, spans(line)) for line in lines]
+        counts = self.counts
+        for line in self.lines[start : start + removed]:
+            for word in line:
+                counts[word] -= 1
+                if not counts[word]:
+                    del counts[word]
+                    self._remove(word)
+                else:
+                    self.tops[self._block(word)] = None
+        for line in new:
+            for word in line:
+                if not counts[word]:
+                    self._insert(word)
+                else:
+                    self.tops[self._block(word)] = None
+                counts[word] += 1
+        self.lines[start : start + removed] = new
+
+    def complete(self, prefix: str, limit: int) -> list:
+        """
+        The most used words starting with prefix, not counting prefix itself
+        """
+        end = prefix[:-1] + chr(ord(prefix[-1]) + 1)  # First word past the prefix
+        first, last = self._block(prefix), self._block(end)
+        candidates = []
+        for i in range(first, last + 1):
+            block = self.blocks[i]
+            if first < i < last and limit <= TOP:  # Whole block matches
+                if self.tops[i] is None:
+                    self.tops[i] = self._top(block)
+                candidates.extend(self.tops[i][:limit])
+            else:
+                lo = bisect_left(block, prefix) if i == first else 0
+                hi = bisect_left(block, end) if i == last else len(block)
+                candidates.extend(block[lo:hi])
+        if candidates and candidates[0] == prefix:
+            del candidates[0]
+        return heapq.nlargest(limit, candidates, key=self.counts.__getitem__)
+
+    def _top(self, block: list) -> list:
+        return heapq.nlargest(TOP, block, key=self.counts.__getitem__)
+
+    def _block(self, word: str) -> int:
+        """
+        Index of the block word is in, or would go in
+        """
+        return max(0, bisect_right(self.firsts, word) - 1)
+
+    def _insert(self, word: str) -> None:
+        i = self._block(word)
+        block = self.blocks[i]
+        block.insert(bisect_left(block, word), word)
+        self.firsts[i], self.tops[i] = block[0], None
+        if len(block) > BLOCK * 2:  # Split it in half
+            half = block[BLOCK:]
+            del block[BLOCK:]
+            self.blocks.insert(i + 1, half)
+            self.firsts.insert(i + 1, half[0])
+            self.tops.insert(i + 1, None)
+
+    def _remove(self, word: str) -> None:
+        i = self._block(word)
+        block = self.blocks[i]
+        del block[bisect_left(block, word)]
+        if not block and len(self.blocks) > 1:
+            del self.blocks[i], self.firsts[i], self.tops[i]
+        else:
+            self.firsts[i], self.tops[i] = (block[0] if block else ""), None
@@ -6,40 +6,117 @@
 import curses
 import traceback
 import sys
+import os
 import re
+import argparse
+import bisect
+import time
+from array import array
 import CursesBoxes
+import Diff
+import FileIndex
+import Highlight
+import Streams
+import Structure
+import Words
 
 
 class Inputs:
     CTRL_O = 15
     CTRL_A = 1
     CTRL_X = 24
+    CTRL_G = 7
+    CTRL_T = 20
+    CTRL_B = 2
+    CTRL_K = 11
+    CTRL_F = 6
+    CTRL_BRACKET = 29  # Ctrl+]
+    CTRL_N = 14
+    CTRL_P = 16
+    CTRL_R = 18
+    CTRL_E = 5
+    CTRL_SPACE = 0
+    CTRL_W = 23
     ARROW_DOWN = 258
     ARROW_UP = 259
     ARROW_LEFT = 260
     ARROW_RIGHT = 261
-
-    MOVEMENT = [ARROW_DOWN, ARROW_UP, ARROW_LEFT, ARROW_RIGHT]
-    OVERRIDES = [CTRL_O, CTRL_A, CTRL_X]
+    HOME = 262
+    END = 360
+    PAGE_DOWN = 338
+    PAGE_UP = 339
+    RESIZE = 410  # curses.KEY_RESIZE
+
+    MOVEMENT = [
+        ARROW_DOWN,
+        ARROW_UP,
+        ARROW_LEFT,
+        ARROW_RIGHT,
+        HOME,
+        END,
+        PAGE_DOWN,
+        PAGE_UP,
+        CTRL_T,
+        CTRL_B,
+        CTRL_F,
+        CTRL_BRACKET,
+        CTRL_N,
+        CTRL_P,
+        CTRL_W,
+    ]
+    OVERRIDES = [CTRL_O, CTRL_A, CTRL_X, CTRL_G, CTRL_K, CTRL_R, CTRL_E, CTRL_SPACE]
 
 
 class FileEditor:
-    def __init__(self, file: str = "") -> None:
+    def __init__(
+        self,
+        file: str = "",
+        follow: bool = False,
+        highlight_budget: int = 32 * 1024 * 1024,
+    ) -> None:
+        self.stream = None  # Streams.StreamReader for piped input or follow mode
+        self.stream_behind = False  # The last poll ran out of time with more to read
+        self.follow = follow  # Keep reading whatever is appended to the file
+        if file == "-":  # Piped input, so keys have to come from the terminal
+            self.stream = Streams.StreamReader(os.dup(sys.stdin.fileno()))
+            tty = os.open("/dev/tty", os.O_RDONLY)
+            os.dup2(tty, sys.stdin.fileno())
+            os.close(tty)
         self.scr = curses.initscr()
         self.running = False
         self.file_object = None
         self.current_file = file
         self.content = [""]
-        self.original_content = [""]
-        self.parsed_content = {}
+        self.diff = Diff.LineDiff()  # Changes since the file was last saved
+        self.highlights = Highlight.HighlightCache(highlight_budget)
+        self.status = ""  # Shown at the right of the header until the next key
         self.can_move_x, self.can_move_y = True, True
-        self.rows, self.columns = 0, 0
+        self.rows, self.columns = 0, 0  # columns is the width left for text
+        self.gutter = 1  # Columns before the text, for change markers
+        self.page_width = 0  # How far each horizontal scroll moves, see page_start
+        self.wrap = False  # Long lines go onto more rows instead of scrolling
+        self.wrap_width = 0  # Characters on each row when wrapping
+        self.wrap_rows = array("i")  # Rows each line takes when wrapping
+        self.screen_lines = []  # File line shown on each row under the header
         self.file_x, self.file_y = 0, 0
         self.cursor_x, self.cursor_y = 0, 1
         self.max_x = 0
         self.scrolled_x = 0
+        self.top_line = 0  # File line shown on the first row under the header
+        self.top_row = 0  # Rows of top_line scrolled off the top, when wrapping
+        self.structure = Structure.StructureIndex()
+        self.folds = {}  # First line of a fold -> last hidden line
+        self.fold_ends = {}  # Last hidden line -> first line of its fold
+        self.fold_starts = []  # Sorted, to find the fold around a line
+        self.words = None  # Words.WordIndex, built the first time it's needed
+        self.words_behind = None  # Lines edited by a replay, words indexed after it
         self.focus_object = self
         self.focus = "File"
+        self.repaint_pending = False  # Content changed while a box had focus
+        self.suspend_render = False  # Skip drawing while a macro is replayed
+        self.recording = None  # Keys typed since recording started, if it has
+        self.macro = []  # Last recorded keys
+        self.file_index = FileIndex.FileIndex(os.getcwd())  # Walked on first Ctrl+O
 
     def init_color(self) -> None:
         """
@@ -61,13 +138,16 @@ class FileEditor:
         Stickied header containing the filename for now
         """
         # Add * if file is modified
-        filename = (
-            self.current_file + "*"
-            if self.content != self.original_content
-            else self.current_file
-        )
-        header = filename.center(self.columns)
-        self.scr.addstr(0, 0, header, curses.color_pair(1))
+        if self.suspend_render:
+            return
+        filename = self.current_file + "*" if self.diff.modified else self.current_file
+        width = self.columns + self.gutter
+        header = filename.center(width)
+        status = self.status or ("Recording" if self.recording is not None else "")
+        status = status[: width - 1]  # Spilling onto the next row would corrupt it
+        if status:
+            header = header[: width - len(status) - 1] + status + " "
+        self.scr.addstr(0, 0, header[:width], curses.color_pair(1))
         self.move_cursor()
 
     def write_footer() -> None: ...
@@ -78,93 +158,110 @@ class FileEditor:
         If no positions given, it moves to where it should currently be
         Useful for after you write a line, since curses will move cursor
         """
-        x = self.cursor_x if not x else x
+        if self.suspend_render:
+            return
+        x = (self.cursor_x if not x else x) + self.gutter
         y = self.cursor_y if not y else y
         self.scr.move(y, x)
         curses.setsyx(y, x)
         self.scr.refresh()
 
-    def adjust_x(self, old_line: int, new_line: int) -> None:
+    def update_dimensions(self) -> None:
+        """
+        Reads the terminal size, leaving out the gutter from self.columns
+        """
+        self.rows, width = self.scr.getmaxyx()
+        self.columns = width - self.gutter
+        self.page_width = self.columns - 6
+        self.wrap_width = self.columns - 1
+        if self.wrap:  # Every line wraps at a new width
+            self.measure_wraps()
+
+    def measure_wraps(self) -> None:
+        """
+        Works out how many rows every line takes, for wrap mode
+        There's always room for the cursor after the last character
+        """
+        width = self.wrap_width
+        self.wrap_rows = array("i", (len(line) // width + 1 for line in self.content))
+
+    def page_of(self, x: int) -> int:
+        """
+        Which horizontal scroll page x is shown on, 0 being unscrolled
+        """
+        if x < self.columns - 2:
+            return 0
+        return (x - (self.columns - 2)) // self.page_width + 1
+
+    def page_start(self, page: int) -> int:
+        """
+        The index write_line starts from for a horizontal scroll page
+        """
+        if page == 0:
+            return 0
+        return self.page_width * page - 1
+
+    def adjust_x(self, old_line: int, new_line: int, old_y: int = None) -> None:
         """
         Make sure the cursor stays at the most optimal x value possible
         max_x should be moved when x is modified by user input, but not automatically
+        old_y is the screen row of old_line, if it isn't just the line difference away
         """
+        if self.wrap:  # Nothing scrolls sideways, the cursor may change rows
+            self.file_x = min(len(self.content[new_line]), self.max_x)
+            if self.place_wrapped_cursor():
+                self.write_content()
+            return
+
         old_content = self.content[old_line]
         new_content = self.content[new_line]
-        new_start = ""
-
-        if self.scrolled_x:
-            # Write the old line back at the first page
-            self.write_line(self.cursor_y + (old_line - new_line), old_content)
-
-        if len(new_content) <= self.max_x:
-            # If the new line is shorter than current x position
-            self.file_x = len(new_content)
-            if len(new_content) < self.columns - 2:
-                # If the new line is smaller than the screen
-                self.cursor_x = self.file_x
-            else:
-                # If the new line is larger than the screen
-                self.scrolled_x = (
-                    (self.file_x - (self.columns - 2)) // (self.columns - 6)
-                ) + 1
-                self.scrolled_x = max(0, self.scrolled_x)
-                new_start = (
-                    (self.columns - 7) + ((self.columns - 6) * (self.scrolled_x - 1))
-                    if self.scrolled_x != 0
-                    else 0
-                )
-                self.cursor_x = len(new_content) - new_start - 1
-                self.write_line(self.cursor_y, new_content, index=new_start)
 
+        if old_y is None:
+            old_y = self.cursor_y + (old_line - new_line)
+        if self.scrolled_x and 0 < old_y < self.rows:
+            # Write the old line back at the first page, if it's still on screen
+            self.write_line(old_y, old_content)
+
+        # The new line may be shorter than the current x position
+        self.file_x = min(len(new_content), self.max_x)
+        self.scrolled_x = self.page_of(self.file_x)
+        if self.scrolled_x == 0:
+            # x is on the first screen
+            self.cursor_x = self.file_x
         else:
-            if self.scrolled_x:
-                # If the new line is larger than the max position
-                self.file_x = self.max_x
-                self.scrolled_x = (
-                    (self.max_x - (self.columns - 2)) // (self.columns - 6)
-                ) + 1
-                self.scrolled_x = max(0, self.scrolled_x)
-                # 82, 165, 248 ((self.columns-7)+((self.columns-6)*(self.scrolled_x-1)))
-                # self.columns = 89
-                new_start = (
-                    (self.columns - 7) + ((self.columns - 6) * (self.scrolled_x - 1))
-                    if self.scrolled_x != 0
-                    else 0
-                )
-                self.cursor_x = self.max_x - new_start - 1
-                self.write_line(self.cursor_y, new_content, index=new_start)
-            else:
-                # If the new line and current line are both on the first screen
-                self.file_x = self.max_x
-                self.cursor_x = self.file_x
+            # x is past the first screen, scroll the new line to it
+            new_start = self.page_start(self.scrolled_x)
+            self.cursor_x = self.file_x - new_start - 1
+            self.write_line(self.cursor_y, new_content, index=new_start)
 
     def handle_movement(self, direction: int) -> bool:
         """
         given an ascii int, will process movement
         """
+        if self.wrap and self.handle_wrapped_movement(direction):
+            return True
 
         match direction:
             case Inputs.ARROW_DOWN:  # Arrow Down
-                if self.file_y + 1 < len(self.content):
-                    # If there is a line under cursor
+                if self.next_line(self.file_y) < len(self.content):
+                    # If there is a line under cursor (folds are stepped over)
                     old_line = self.file_y
-                    self.file_y += 1
+                    self.file_y = self.next_line(self.file_y)
                     new_line = self.file_y
                     if self.cursor_y + 1 < self.rows:
                         # If the cursor is not at the bottom of the screen
                         self.cursor_y += 1
                     else:
                         # If the cursor is at the bottom
-                        self.write_content(self.file_y - self.rows + 2)
+                        self.write_content(self.next_line(self.top_line))
 
-                    self.adjust_x(old_line, new_line)
+                    self.adjust_x(old_line, new_line, old_y=self.cursor_y - 1)
 
             case Inputs.ARROW_UP:  # Arrow up
                 if self.file_y - 1 >= 0:
                     # If there is a line before the current line
                     old_line = self.file_y
-                    self.file_y -= 1
+                    self.file_y = self.prev_line(self.file_y)
                     new_line = self.file_y
                     if self.cursor_y - 1 > 0:
                         # If the cursor is not at the start of the screen
@@ -173,7 +270,7 @@ class FileEditor:
                         # If the cursor is at the top
                         self.write_content(self.file_y)
 
-                    self.adjust_x(old_line, new_line)
+                    self.adjust_x(old_line, new_line, old_y=self.cursor_y + 1)
 
             case Inputs.ARROW_LEFT:  # Arrow left
                 if self.file_x - 1 >= 0:
@@ -215,12 +312,334 @@ class FileEditor:
 
                     self.max_x = self.file_x
 
+            case Inputs.HOME:
+                if self.scrolled_x:
+                    self.write_line(self.cursor_y, self.content[self.file_y])
+                    self.scrolled_x = 0
+                self.file_x, self.cursor_x, self.max_x = 0, 0, 0
+
+            case Inputs.END:
+                self.max_x = len(self.content[self.file_y])
+                self.adjust_x(self.file_y, self.file_y)
+
+            case Inputs.PAGE_DOWN:
+                self.jump_to(self.step_lines(self.file_y, self.rows - 1))
+
+            case Inputs.PAGE_UP:
+                self.jump_to(self.step_lines(self.file_y, -(self.rows - 1)))
+
+            case Inputs.CTRL_T:  # Top of file
+                self.jump_to(0)
+
+            case Inputs.CTRL_B:  # Bottom of file
+                self.jump_to(len(self.content) - 1)
+
+            case Inputs.CTRL_F:  # Fold or unfold the block under the cursor
+                self.toggle_fold(self.file_y)
+
+            case Inputs.CTRL_N:  # Next change since the last save
+                line = self.diff.next_change(self.file_y)
+                if line is not None:
+                    self.jump_to(line, row=self.screen_row(line))
+
+            case Inputs.CTRL_P:  # Previous change
+                line = self.diff.prev_change(self.file_y)
+                if line is not None:
+                    self.jump_to(line, row=self.screen_row(line))
+
+            case Inputs.CTRL_W:  # Soft wrap long lines, or stop wrapping
+                self.toggle_wrap()
+
+            case Inputs.CTRL_BRACKET:  # Matching bracket
+                for column in (self.file_x, self.file_x - 1):
+                    match = self.structure.match_bracket(self.file_y, column)
+                    if match is not None:
+                        self.max_x = match[1]
+                        self.jump_to(match[0])
+                        break
+
             case _:
                 return False
 
         self.move_cursor()
         return True  # Was an arrow key
 
+    def handle_wrapped_movement(self, direction: int) -> bool:
+        """
+        Arrow keys, Home and End for wrap mode, where up and down
+        go by the rows on screen instead of by lines
+        Returns False for keys that move the same either way
+        """
+        width = self.wrap_width
+        line = self.content[self.file_y]
+        column = self.max_x % width  # Where up and down try to stay on a row
+
+        match direction:
+            case Inputs.ARROW_DOWN:
+                if self.file_x // width < len(line) // width:  # Next row of the line
+                    self.file_x = min(
+                        (self.file_x // width + 1) * width + column, len(line)
+                    )
+                elif self.next_line(self.file_y) < len(self.content):
+                    self.file_y = self.next_line(self.file_y)
+                    self.file_x = min(column, len(self.content[self.file_y]))
+
+            case Inputs.ARROW_UP:
+                if self.file_x >= width:  # Previous row of the line
+                    self.file_x = (self.file_x // width - 1) * width + column
+                elif self.file_y > 0:
+                    self.file_y = self.prev_line(self.file_y)
+                    line = self.content[self.file_y]
+                    self.file_x = min(len(line) // width * width + column, len(line))
+
+            case Inputs.ARROW_LEFT:
+                if self.file_x > 0:
+                    self.file_x -= 1
+                    self.max_x = self.file_x
+
+            case Inputs.ARROW_RIGHT:
+                if self.file_x < len(line):
+                    self.file_x += 1
+                    self.max_x = self.file_x
+
+            case Inputs.HOME:
+                self.file_x, self.max_x = 0, 0
+
+            case Inputs.END:
+                self.file_x, self.max_x = len(line), len(line)
+
+            case _:
+                return False
+
+        if self.place_wrapped_cursor():
+            self.write_content()
+        self.move_cursor()
+        return True
+
+    def place_wrapped_cursor(self) -> bool:
+        """
+        Works out the cursor's row and column from file_x in wrap mode
+        Moves top_line (and top_row, for a line taller than the screen) if that
+        row is off screen, returns True if it did, so the caller can repaint
+        """
+        view = self.rows - 1
+        row = self.file_x // self.wrap_width  # Row within the line
+        scrolled = True
+        if self.file_y < self.top_line:  # Show the line from its start if it fits
+            self.top_line, self.top_row = self.file_y, row if row >= view else 0
+        elif self.file_y == self.top_line and row < self.top_row:
+            self.top_row = row
+        elif self.rows_above(self.file_y) + row >= view:  # Cursor on the last row
+            above = view - 1 - row
+            if above < 0:  # Only part of the line fits
+                self.top_line, self.top_row = self.file_y, -above
+            else:
+                self.top_line, self.top_row = self.top_for(self.file_y, above)
+        else:
+            scrolled = False
+        self.cursor_y = 1 + self.rows_above(self.file_y) + row
+        self.cursor_x = self.file_x % self.wrap_width
+        return scrolled
+
+    def rows_above(self, line: int) -> int:
+        """
+        Rows on screen above line, which is at or below top_line, in wrap mode
+        Stops counting once it's past the bottom of the screen
+        """
+        limit = self.rows - 1 + self.top_row
+        return self.count_lines(self.top_line, limit, stop=line) - self.top_row
+
+    def toggle_wrap(self) -> None:
+        """
+        Switches wrap mode, keeping the cursor where it is in the file
+        """
+        self.wrap = not self.wrap
+        if self.wrap:
+            self.measure_wraps()
+        else:
+            self.wrap_rows = array("i")
+        self.repaint()
+
+    def jump_to(self, line: int, row: int = None) -> None:
+        """
+        Moves the cursor straight to line, with a single repaint
+        row is the screen row line should end up on; by default the cursor
+        keeps its row. x follows max_x, same as arrowing up and down
+        Only the rows on screen are stepped through, however far the jump is
+        """
+        view = self.rows - 1  # Rows under the header
+        old_line = min(self.file_y, len(self.content) - 1)  # It may have been removed
+        line = max(0, min(line, len(self.content) - 1))
+        self.reveal(line)
+        row = max(1, min(self.cursor_y if row is None else row, view))
+
+        below = self.count_lines(line, view)
+        # Don't leave rows empty at the bottom if the file can fill them
+        top, top_row = self.top_for(line, max(row - 1, view - below))
+
+        self.file_y = line
+        self.cursor_y = 1 + self.count_lines(top, view + top_row, stop=line) - top_row
+        self.write_content(top, top_row=top_row)
+        self.adjust_x(old_line, line, old_y=0)  # Old line was just repainted
+        self.move_cursor()
+
+    def screen_row(self, line: int) -> int:
+        """
+        Row line is drawn on, None if it's off screen
+        """
+        if line in self.screen_lines:
+            return self.screen_lines.index(line) + 1
+        return None
+
+    def next_line(self, line: int) -> int:
+        """
+        The line shown after line, stepping over a fold that starts there
+        """
+        return self.folds.get(line, line) + 1
+
+    def prev_line(self, line: int) -> int:
+        """
+        The line shown before line, stepping back over a fold that ends above it
+        """
+        return self.fold_ends.get(line - 1, line - 1)
+
+    def step_lines(self, line: int, count: int) -> int:
+        """
+        Moves count shown lines down (or up if negative), stopping at either end
+        """
+        for _ in range(abs(count)):
+            step = self.next_line(line) if count > 0 else self.prev_line(line)
+            if not 0 <= step < len(self.content):
+                break
+            line = step
+        return line
+
+    def back_rows(self, line: int, count: int) -> int:
+        """
+        The shown line that puts line count rows further down the screen
+        Lines that don't fit whole aren't stepped onto
+        """
+        if not self.wrap:
+            return self.step_lines(line, -count)
+        while count > 0 and line > 0:
+            step = self.prev_line(line)
+            count -= self.wrap_rows[step]
+            if count < 0:
+                break
+            line = step
+        return line
+
+    def top_for(self, line: int, count: int) -> tuple:
+        """
+        The top line and top row that put line count rows further down the screen
+        Like back_rows, but when wrapping, a line that doesn't fit whole is
+        shown from part way through instead of leaving its rows to lines below
+        """
+        top = self.back_rows(line, count)
+        shown = self.count_lines(top, count, stop=line)
+        if self.wrap and shown < count and top > 0:
+            top = self.prev_line(top)
+            return top, self.wrap_rows[top] - (count - shown)
+        return top, 0
+
+    def count_lines(self, line: int, limit: int, stop: int = None) -> int:
+        """
+        Counts rows taken by shown lines from line onwards, up to limit or until
+        stop is reached. That's one row a line, unless in wrap mode
+        """
+        count = 0
+        while count < limit and line < len(self.content) and line != stop:
+            count += self.wrap_rows[line] if self.wrap else 1
+            line = self.next_line(line)
+        return count
+
+    def fold_around(self, line: int) -> int:
+        """
+        Returns the start of the fold hiding line, or None if it's shown
+        """
+        i = bisect.bisect_left(self.fold_starts, line) - 1
+        if i >= 0 and self.folds[self.fold_starts[i]] >= line:
+            return self.fold_starts[i]
+        return None
+
+    def reveal(self, line: int) -> None:
+        """
+        Opens the fold line is hidden in, if it is
+        """
+        start = self.fold_around(line)
+        if start is not None:
+            self.remove_fold(start)
+
+    def add_fold(self, start: int, end: int) -> None:
+        for inner in [s for s in self.fold_starts if start < s <= end]:
+            self.remove_fold(inner)  # Folds don't nest, the outer one wins
+        self.folds[start] = end
+        self.fold_ends[end] = start
+        bisect.insort(self.fold_starts, start)
+
+    def remove_fold(self, start: int) -> None:
+        end = self.folds.pop(start)
+        del self.fold_ends[end]
+        self.fold_starts.remove(start)
+
+    def toggle_fold(self, line: int) -> None:
+        """
+        Folds the block line opens, or unfolds it if it's already folded
+        """
+        if line in self.folds:
+            self.remove_fold(line)
+        else:
+            end = self.structure.fold_end(line)
+            if end is None:
+                return
+            self.add_fold(line, end)
+        self.write_content()
+
+    def lines_changed(
+        self, start: int, removed: int, added: int, edit: bool = True
+    ) -> None:
+        """
+        Called after self.content[start:start + removed] is replaced by added lines
+        Keeps the structure index, change markers and folds in line with the content
+        edit is False for text that was also added to the file (follow mode)
+        """
+        self.structure.update(start, removed, self.content[start : start + added])
+        if self.wrap:
+            width = self.wrap_width
+            self.wrap_rows[start : start + removed] = array(
+                "i",
+                (
+                    len(line) // width + 1
+                    for line in self.content[start : start + added]
+                ),
+            )
+        if self.words_behind is not None:
+            self.words_behind = self.span_edit(self.words_behind, start, removed, added)
+        elif self.words is not None:
+            # Lines that fit on screen are drawn next, so they're parsed for it now
+            spans = self.highlight if added < self.rows else self.highlights.peek
+            self.words.update(
+                start, removed, self.content[start : start + added], spans
+            )
+        if edit:
+            self.diff.changed(start, removed, added, self.content)
+        else:
+            self.diff.appended(start, self.content)
+        shift = added - removed
+        if not self.folds or (shift == 0 and self.fold_around(start) is None):
+            return  # Nothing hidden was touched, and nothing moved
+        folds = {}
+        for fold_start, fold_end in self.folds.items():
+            if fold_end < start:  # Above the change
+                folds[fold_start] = fold_end
+            elif fold_start >= start + removed:  # Below the change
+                folds[fold_start + shift] = fold_end + shift
+            elif shift == 0 and fold_start == start:  # Only its first line was edited
+                folds[fold_start] = fold_end
+        self.folds = folds
+        self.fold_ends = {end: start for start, end in folds.items()}
+        self.fold_starts = sorted(folds)
+
     def handle_override(self, inp) -> None:
         """
         Overrides are things that can be executed at any time
@@ -228,54 +647,182 @@ class FileEditor:
         """
         match inp:
             case Inputs.CTRL_O:  # Open File
-                if self.content != self.original_content:
+                if self.diff.modified:
                     box = CursesBoxes.SaveBox(height=10, width=self.columns // 2)
                     self.focus_object = box
                     self.focus = "SaveBox"
-                    box.draw(scr=self.scr, y=self.rows // 3, x=self.columns // 2 // 2)
+                    box.draw(self.scr, *self.overlay_position())
                     while not self.wait_for_response():
                         pass
-                box = CursesBoxes.InputBox(
-                    height=10, width=self.columns // 2, title="Enter File Name"
+                self.file_index.refresh()  # First walk, or only changed directories
+                box = CursesBoxes.FileBox(
+                    height=max(10, self.rows * 2 // 3),
+                    width=self.columns * 3 // 4,
+                    title="Open File",
+                    finder=FileIndex.FuzzyQuery(self.file_index, limit=0),
                 )
                 self.focus_object = box
                 self.focus = "OpenFile"
-                box.draw(scr=self.scr, y=self.rows // 3, x=self.columns // 2 // 2)
+                box.draw(self.scr, *self.overlay_position())
 
             case Inputs.CTRL_X:  # Close App
-                if self.content != self.original_content:
+                if self.diff.modified:
                     box = CursesBoxes.SaveBox(height=10, width=self.columns // 2)
                     self.focus_object = box
                     self.focus = "SaveBox"
-                    box.draw(scr=self.scr, y=self.rows // 3, x=self.columns // 2 // 2)
+                    box.draw(self.scr, *self.overlay_position())
                     while not self.wait_for_response():
                         pass
                 self.close()
 
+            case Inputs.CTRL_G:  # Go to line
+                if self.focus == "File":
+                    box = CursesBoxes.InputBox(
+                        height=10, width=self.columns // 2, title="Go To Line"
+                    )
+                    self.focus_object = box
+                    self.focus = "GoToLine"
+                    box.draw(self.scr, *self.overlay_position())
+
+            case Inputs.CTRL_R:  # Start or stop recording a macro
+                if self.focus == "File":
+                    if self.recording is None:
+                        self.recording = []
+                    else:
+                        self.macro, self.recording = self.recording, None
+                        self.status = "Recorded %d keys" % len(self.macro)
+                    self.write_header()
+
+            case Inputs.CTRL_E:  # Replay the macro
+                if self.focus == "File" and self.recording is None and self.macro:
+                    box = CursesBoxes.InputBox(
+                        height=10,
+                        width=self.columns // 2,
+                        title="Replay How Many Times",
+                    )
+                    self.focus_object = box
+                    self.focus = "Replay"
+                    box.draw(self.scr, *self.overlay_position())
+
+            case Inputs.CTRL_SPACE:  # Complete the word before the cursor
+                if self.focus == "File":
+                    self.complete_word()
+
+            case Inputs.CTRL_K:  # Highlight memory use
+                if self.focus == "File":
+                    self.report_highlights()
+
             case Inputs.CTRL_A:
                 if self.focus != "File":
-                    self.focus_object = self
-                    self.focus = "File"
-                    self.write_content(self.file_y, self.file_x)
+                    self.close_overlay()
+
+    def overlay_position(self) -> tuple:
+        """
+        Where the focused box goes on the current screen, as (y, x)
+        Kept inside the screen, so boxes can be moved back on after a resize
+        """
+        box = self.focus_object
+        if self.focus == "OpenFile":
+            y, x = self.rows // 6, self.columns // 8
+        elif self.focus == "Complete":  # Under the word, or over it near the bottom
+            y = self.cursor_y + 1
+            if y + box.height > self.rows:
+                y = self.cursor_y - box.height
+            x = self.cursor_x + self.gutter - len(box.prefix) - 2
+        else:
+            y, x = self.rows // 3, self.columns // 2 // 2
+        y = max(0, min(y, self.rows - box.height))
+        x = max(0, min(x, self.columns + self.gutter - box.width))
+        return y, x
+
+    def handle_resize(self) -> None:
+        """
+        Lays everything out again for the new terminal size
+        A drag sends a burst of resize events, they're all read first
+        so the screen is only redrawn once. Highlighting is kept, as it
+        only depends on the text of each line
+        """
+        self.scr.timeout(0)
+        inp = self.scr.getch()
+        while inp == Inputs.RESIZE:
+            inp = self.scr.getch()
+        if inp != -1:  # Something else was typed, leave it for next time
+            curses.ungetch(inp)
+
+        self.update_dimensions()
+        self.scr.clear()  # The terminal may have reflowed the old text
+        self.cursor_y = min(self.cursor_y, self.rows - 1)
+        self.repaint()  # Page breaks have moved too
+        if self.focus_object is not self:
+            self.focus_object.draw(self.scr, *self.overlay_position())
+
+    def close_overlay(self) -> None:
+        """
+        Hides the focused box and gives focus back to the editor
+        The box is on its own panel, so the text underneath needs no repaint
+        """
+        if self.focus_object is not self:
+            self.focus_object.hide()
+        self.focus_object = self
+        self.focus = "File"
+        if self.repaint_pending:
+            self.repaint_pending = False
+            self.write_header()
+            self.write_content()
+        self.move_cursor()
 
     def wait_for_response(self) -> None:
         """
         Call this in a while loop to suspend until
-        Current overlay is closed
+        Current overlay is closed, and any box it opened after it
         """
-        temp = self.focus_object
         self.handle_input()
-        if temp != self.focus_object:
-            return True
-        return False
+        return self.focus_object is self
+
+    def poll_interval(self) -> int:
+        """
+        How long getch waits (ms) before handle_idle gets a turn
+        -1 blocks, which is the case unless something is working in the background
+        """
+        if getattr(self.focus_object, "busy", False):
+            return 20
+        if self.stream and not self.stream.closed:
+            return 0 if self.stream_behind else 100
+        return -1
+
+    def handle_idle(self) -> None:
+        """
+        Lets background work (like ranking files) continue between keystrokes
+        """
+        if self.stream and not self.stream.closed:
+            self.poll_stream()
+        if getattr(self.focus_object, "busy", False):
+            self.focus_object.tick()
 
     def handle_input(self) -> None:
+        """
+        Waits for a key, or for background work to need a turn
+        """
+        self.scr.timeout(self.poll_interval())
+        inp = self.scr.getch()  # Wait for input
+        if inp == -1:  # Timed out, nothing was typed
+            self.handle_idle()
+        elif inp == Inputs.RESIZE:
+            self.handle_resize()
+        else:
+            self.process_input(inp)
+
+    def process_input(self, inp: int) -> None:
         """
         The ever-growing function which handles all input
         in the console
         """
-        self.rows, self.columns = self.scr.getmaxyx()  # Update Dimensions
-        inp = self.scr.getch()  # Wait for input
+        if self.recording is not None and self.focus == "File":
+            if inp not in Inputs.OVERRIDES:  # Boxes can't be replayed
+                self.recording.append(inp)
+        if self.status:  # Status messages last until the next key
+            self.status = ""
+            self.write_header()
         if inp in Inputs.OVERRIDES:  # Handle overrides immediately
             self.handle_override(inp)
         elif type(self.focus_object) != type(
@@ -286,53 +833,89 @@ class FileEditor:
             )  # Send input to be handled by external object
             match self.focus:
                 case "SaveBox":
-                    if res == True:  # Y, or if user hits enter on "YES"
+                    if res == True and self.current_file == "-":
+                        self.close_overlay()  # Piped in, so ask where to write it
+                        box = CursesBoxes.InputBox(
+                            height=10, width=self.columns // 2, title="Save As"
+                        )
+                        self.focus_object = box
+                        self.focus = "SaveAs"
+                        box.draw(self.scr, *self.overlay_position())
+                    elif res == True:  # Y, or if user hits enter on "YES"
                         self.save_file()
-                        # Fix focus
-                        self.focus_object = self
-                        self.focus = "File"
+                        self.close_overlay()  # Fix focus
                     elif res == False:  # N, or if user hits enter on "NO"
-                        self.focus_object = self
-                        self.focus = "File"
+                        self.close_overlay()
+
+                case "SaveAs":
+                    if res is not None:
+                        self.close_overlay()
+                        if res.strip() and res.strip() != "-":  # Blank doesn't save
+                            self.current_file = res.strip()
+                            self.save_file()
 
                 case "OpenFile":
                     if res:
+                        self.close_overlay()  # Fix focus
                         self.read_file(res)  # Returns text entered on return input
-                        # Fix focus
-                        self.focus_object = self
-                        self.focus = "File"
+
+                case "GoToLine":
+                    if res is not None:
+                        self.close_overlay()
+                        if res.isdigit():
+                            self.jump_to(int(res) - 1)  # Lines start at 1 for users
+
+                case "Replay":
+                    if res is not None:
+                        self.close_overlay()
+                        if res.isdigit():
+                            self.replay_macro(int(res))
+                        elif not res.strip():
+                            self.replay_macro()  # Blank runs to the end of the file
+
+                case "Complete":
+                    if res is not None:
+                        prefix = self.focus_object.prefix
+                        self.close_overlay()
+                        if res is False:  # Typing carries on as normal
+                            self.process_input(inp)
+                        else:
+                            self.insert_completion(prefix, res)
 
         else:
             move = self.handle_movement(inp)  # Attempt to interpret as movement
             if not move:  # If it isn't a movement key
                 line = self.content[self.file_y]
+                suspended = self.suspend_render
+                if self.wrap:  # Rows can shift, they're all drawn once it's done
+                    self.suspend_render = True
                 if inp == 8 or inp == 127:  # Backspace
                     if self.file_x - 1 >= 0:  # Can erase character
                         line = line[: self.file_x - 1] + line[self.file_x :]
                         self.content[self.file_y] = line
+                        self.lines_changed(self.file_y, 1, 1)
                         self.write_line(self.cursor_y, line)
                         self.handle_movement(
                             Inputs.ARROW_LEFT
                         )  # Backspace should move cursor left
                         if self.file_x > self.columns - 2:
                             self.adjust_x(self.file_y, self.file_y)
-                    else:  # Erasing start of line
+                    elif self.file_y > 0:  # Erasing start of line
+                        self.reveal(self.file_y - 1)  # Can't join onto a hidden line
                         line_end = len(self.content[self.file_y - 1])
-                        self.content[self.file_y - 1] += self.content[self.file_y]
-                        self.content = (
-                            self.content[: self.file_y]
-                            + self.content[self.file_y + 1 :]
+                        row = self.cursor_y - (
+                            self.wrap_rows[self.file_y - 1] if self.wrap else 1
                         )
-                        self.write_content()
-                        self.file_y -= 1
-                        self.cursor_y -= 1
-                        self.file_x = line_end
-                        self.cursor_x = line_end
-                        self.adjust_x(self.file_y + 1, self.file_y)
+                        self.content[self.file_y - 1] += self.content[self.file_y]
+                        del self.content[self.file_y]
+                        self.lines_changed(self.file_y - 1, 2, 1)
+                        self.max_x = line_end  # Cursor goes where the lines met
+                        self.jump_to(self.file_y - 1, row=row)
 
                 # Tab (or Ctrl+I)
                 elif inp == 9:
                     self.content[self.file_y] = (" " * 4) + self.content[self.file_y]
+                    self.lines_changed(self.file_y, 1, 1)
                     for _ in range(4):
                         self.handle_movement(Inputs.ARROW_RIGHT)
                     self.write_line(self.cursor_y, self.content[self.file_y])
@@ -341,17 +924,10 @@ class FileEditor:
                 # Return
                 elif inp == 10:
                     line = line[0 : self.file_x] + "\n" + line[self.file_x :]
-                    self.content = (
-                        self.content[: self.file_y]
-                        + line.split("\n")
-                        + self.content[self.file_y + 1 :]
-                    )
-                    self.write_content()
-                    self.file_y += 1
-                    self.cursor_y += 1
-                    self.file_x = 0
-                    self.cursor_x = 0
-                    self.adjust_x(self.file_y - 1, self.file_y)
+                    self.content[self.file_y : self.file_y + 1] = line.split("\n")
+                    self.lines_changed(self.file_y, 1, 2)
+                    self.max_x = 0  # Start of the new line
+                    self.jump_to(self.file_y + 1, row=self.cursor_y + 1)
 
                 # Real ASCII Letter Inputs
                 elif inp >= 32 and inp <= 126:
@@ -360,6 +936,7 @@ class FileEditor:
                     except IndexError:
                         line += chr(inp)
                     self.content[self.file_y] = line
+                    self.lines_changed(self.file_y, 1, 1)
                     self.write_line(self.cursor_y, line)
                     self.handle_movement(Inputs.ARROW_RIGHT)
                     if self.file_x > self.columns - 2:
@@ -369,182 +946,436 @@ class FileEditor:
                 elif inp == 353:
                     if self.content[self.file_y].startswith(" " * 4):
                         self.content[self.file_y] = self.content[self.file_y][4:]
+                        self.lines_changed(self.file_y, 1, 1)
                         for _ in range(4):
                             self.handle_movement(Inputs.ARROW_LEFT)
                         self.write_line(self.cursor_y, self.content[self.file_y])
                         self.adjust_x(self.file_y, self.file_y)
 
+                if self.wrap:
+                    self.suspend_render = suspended
+                    self.place_wrapped_cursor()
+                    self.write_content()
+                self.write_gutter()
                 self.move_cursor()  # Adjust cursor
                 self.write_header()  # In case file is now modified
                 self.max_x = self.file_x  # Cursor is *always* manually moved here
 
+    def complete_word(self) -> None:
+        """
+        Suggests words from the file starting with the one before the cursor
+        A single match is filled in straight away, more are shown in a box
+        """
+        match = re.search(r"\b[A-Za-z_]\w*$", self.content[self.file_y][: self.file_x])
+        if match is None:
+            return
+        prefix = match.group()
+        if self.words is None:  # Built once, lines_changed keeps it up to date
+            self.words = Words.WordIndex()
+            self.words.reset(self.content, self.highlights.peek)
+        options = self.words.complete(prefix, limit=max(1, min(10, self.rows // 2)))
+        if not options:
+            self.status = "No completions"
+            self.write_header()
+        elif len(options) == 1:
+            self.insert_completion(prefix, options[0])
+        else:
+            box = CursesBoxes.CompletionBox(options, prefix)
+            self.focus_object = box
+            self.focus = "Complete"
+            box.draw(self.scr, *self.overlay_position())
+
+    def insert_completion(self, prefix: str, word: str) -> None:
+        """
+        Finishes typing word, of which prefix is already before the cursor
+        """
+        rest = word[len(prefix) :]
+        line = self.content[self.file_y]
+        line = line[: self.file_x] + rest + line[self.file_x :]
+        self.content[self.file_y] = line
+        self.lines_changed(self.file_y, 1, 1)
+        self.max_x = self.file_x + len(rest)
+        if self.wrap:
+            self.adjust_x(self.file_y, self.file_y)
+            self.write_content()  # The line may take more rows now
+        else:
+            self.write_line(self.cursor_y, line)
+            self.adjust_x(self.file_y, self.file_y, old_y=0)  # Scrolls if it has to
+        self.write_gutter()
+        self.move_cursor()
+        self.write_header()
+
+    def replay_macro(self, count: int = None) -> None:
+        """
+        Runs the recorded keys count times, or until a run ends without the
+        cursor moving down (the end of the file). Nothing is drawn until
+        the end, then the screen is repainted once
+        """
+        runs = 0
+        limit = len(self.content) if count is None else count
+        self.suspend_render = True
+        if self.words is not None:
+            self.words_behind = ()
+        try:
+            while runs < limit:
+                line = self.file_y
+                for inp in self.macro:
+                    self.process_input(inp)
+                runs += 1
+                if count is None and self.file_y <= line:
+                    break
+        finally:
+            self.suspend_render = False
+            if self.words_behind:
+                start, removed, end = self.words_behind
+                self.words.update(
+                    start, removed, self.content[start:end], self.highlights.peek
+                )
+            self.words_behind = None
+        self.status = "Ran macro %d times" % runs
+        self.repaint()
+
+    @staticmethod
+    def span_edit(span: tuple, start: int, removed: int, added: int) -> tuple:
+        """
+        Grows span, (start, lines it replaced, end), to take in another edit
+        An empty span is started by it
+        """
+        if not span:
+            return start, removed, start + added
+        first, replaced, end = span
+        lo, hi = min(first, start), max(end, start + removed)
+        replaced += first - lo + hi - end
+        return lo, replaced, hi + added - removed
+
+    def repaint(self) -> None:
+        """
+        Draws everything again from the cursor position
+        Horizontal scrolling is worked out again from file_x
+        """
+        self.cursor_x, self.scrolled_x = 0, 0
+        self.max_x = self.file_x  # jump_to scrolls back to it
+        self.jump_to(self.file_y)
+        self.write_header()
+
     def clear_screen(self) -> None:
         """
         Clear everything on the screen, excluding header/footer
         """
+        width = self.columns + self.gutter
         for line in range(1, self.rows - 1):
-            self.scr.addstr(line, 0, " " * self.columns)
-        self.scr.addstr(self.rows - 1, 0, " " * (self.columns - 1))
+            self.scr.addstr(line, 0, " " * width)
+        self.scr.addstr(self.rows - 1, 0, " " * (width - 1))
         self.move_cursor()  # Reset cursor
 
-    def parse_line(self, line: str) -> list:
+    def parse_line(self, line: str) -> array:
         """
-        Basically, this returns a list where each character in line is assigned a color
+        Basically, this assigns each character in line a color pair
         based on what it is (definition, declarative, comment, etc.)
+        Returned as run-length spans (see Highlight.compress), not a list per character
         TODO: Multiline support (Needs a separate function)
         """
-        parsed = []
+        parsed = bytearray(len(line))  # Color pair number for each character
         declaratives = r"(class|import|def|if|else|elif|while|for|try|except|or|and|match|case|return|is|in|not|with|as|assert|pass|break|continue)"
 
+        def paint(start: int, end: int, pair: int) -> None:
+            if end > start:
+                parsed[start:end] = bytes((pair,)) * (end - start)
+
         # Default colors for alpha, numeric and non-alphanumeric
-        for char in line:
-            if char.isalnum():
-                color = curses.color_pair(5) if char.isdigit() else curses.color_pair(0)
-            else:
-                color = curses.color_pair(2)
-            parsed.append(color)
+        paint(0, len(line), 2)
+        for match in re.finditer(r"[^\W_]+", line):
+            paint(match.start(), match.end(), 0)
+        for match in re.finditer(r"\d+", line):
+            paint(match.start(), match.end(), 5)
 
         # Declaratives
         for match in re.finditer(f"(\\(|^|\\s){declaratives}(:|\\s)", line):
-            for i in range(match.start(), match.end()):
-                parsed[i] = curses.color_pair(2)
+            paint(match.start(), match.end(), 2)
 
         # Function/Class/Module names
         for word in ["def", "class", "import"]:
             if match := re.search(
                 f"{word}\\s\\S*(\\(|:)", line
             ):  # Walrus operator my beloved
-                for i in range(match.start() + len(word), match.end() - 1):
-                    parsed[i] = curses.color_pair(7)
+                paint(match.start() + len(word), match.end() - 1, 7)
 
         # Dot notation
         for match in re.finditer(r"[^a-zA-Z]{1}[a-zA-Z]*\.", line):
-            for i in range(match.start() + 1, match.end()):
-                parsed[i] = curses.color_pair(3)
-
-        # Comments and Quotes
-        for case in [r"#.*", r'"[^"]*"', r"'[^']*'"]:
-            for match in re.finditer(case, line):
-                for i in range(match.start(), match.end()):
-                    parsed[i] = curses.color_pair(4)
+            paint(match.start() + 1, match.end(), 3)
 
         # Definitions
         for case in [r"^\s*\S*\s*=", r"^\s*\S*\s*(\*=|\+=|-=)"]:
             if match := re.search(case, line):
-                for i in range(match.start(), match.end() - 1):
-                    parsed[i] = curses.color_pair(5)
+                paint(match.start(), match.end() - 1, 5)
 
         # Random Misc
         for match in re.finditer(r"(self|None|True|False)", line):
-            for i in range(match.start(), match.end()):
-                parsed[i] = curses.color_pair(6)
+            paint(match.start(), match.end(), 6)
+
+        # Comments and Quotes, last so nothing shows through them
+        for case in [r"#.*", r'"[^"]*"', r"'[^']*'"]:
+            for match in re.finditer(case, line):
+                paint(match.start(), match.end(), 4)
 
-        return parsed
+        return Highlight.compress(parsed)
 
-    def check_parsed_cache(self, line: str) -> list:
+    def highlight(self, line: str) -> array:
         """
-        Checks self.parsed_content to see if a line is in it
-        Can't directly check, because of how parsing is handled
-        So it checks content first, and matches the content line to parsed line
+        Returns the spans for line, from the cache if it's been parsed before
         """
-        try:
-            line_index = self.content.index(line)
-            if len(self.parsed_content[line_index]) == len(
-                line
-            ):  # Can't compare directly, so compare size
-                return self.parsed_content[line_index]
-            return None  # Not parsed
+        spans = self.highlights.get(line)
+        if spans is None:
+            spans = self.parse_line(line)
+            self.highlights.put(line, spans)
+        return spans
 
-        except ValueError:  # Failed .index
-            return None
+    def report_highlights(self) -> None:
+        """
+        Shows how much memory highlighting is using in the header
+        """
+        mib = 1024 * 1024
+        self.status = "Highlights: %.1f/%.1f MiB, %d lines" % (
+            self.highlights.used / mib,
+            self.highlights.budget / mib,
+            len(self.highlights),
+        )
+        self.write_header()
 
     def write_line(
-        self, y: int, content: str, index: int = 0, parse: bool = True
+        self,
+        y: int,
+        content: str,
+        index: int = 0,
+        parse: bool = True,
+        markers: bool = True,
     ) -> None:
         """
         Writes a line of content, from index on, at the line y
         Takes an optional parse argument
-        True to parse, False to not, or a parsed dict itself
+        True to parse, False to not, or already parsed spans themselves
+        markers is False for a row of a wrapped line, which has no "<" and ">"
         """
-        line = content[index : index + self.columns]
-        line += " " * (self.columns - len(line) + 1)  # Erase any text already there
-
-        parsed = []
+        if self.suspend_render:
+            return
+        width = self.columns - 1
+        left = self.gutter
+        start = index + 1 if index > 0 and markers else index  # "<" covers column 0
+        text = content[start : start + width]
 
         if parse is True:
-            # If it's not in cache, parse it
-            parsed = (
-                self.parse_line(line)
-                if not self.check_parsed_cache(content)
-                else self.check_parsed_cache(content)
-            )
-            parsed = parsed[index : index + self.columns]
-        else:  # Throw default color
-            parsed = [curses.color_pair(0) for i in range(self.columns - 2)]
-
-        if (
-            index > 0
-        ):  # TODO: Fix the weird edge case (should be as easy as removing the 1s in correct_x)
-            line = line[1:]
-            parsed = parsed[1:]
-
-        for i in range(min(self.columns - 1, len(line) - 1)):
-            color = parsed[i] if i < len(parsed) else curses.color_pair(0)
-            self.scr.addch(y, i, line[i], color)
+            spans = self.highlight(content)
+        else:
+            spans = parse or None  # Default color if not parsed
+
+        if spans is not None:
+            for run_start, run_end, pair in Highlight.runs(
+                spans, start, start + len(text)
+            ):
+                self.scr.addstr(
+                    y,
+                    left + run_start - start,
+                    text[run_start - start : run_end - start],
+                    curses.color_pair(pair),
+                )
+        else:
+            self.scr.addstr(y, left, text)
+        self.scr.addstr(y, left + len(text), " " * (width - len(text)))  # Erase old
 
+        if not markers:
+            return
         if index > 0:
-            self.scr.addch(y, 0, "<", curses.color_pair(1))
-        if len(content[index:]) >= self.columns - 2:
-            self.scr.addch(y, self.columns - 2, ">", curses.color_pair(1))
+            self.scr.addch(y, left, "<", curses.color_pair(1))
+        if len(content) - index >= self.columns - 2:
+            self.scr.addch(y, left + self.columns - 2, ">", curses.color_pair(1))
 
-    def write_content(self, line: int = 0, index: int = 0) -> None:
+    def write_content(self, line: int = None, index: int = 0, top_row: int = 0) -> None:
         """
         Writes all the content in self.content from line to end of screen
+        line defaults to the line already at the top of the screen
         Optional index in case of horizontal scrolling
+        top_row is how many rows of a new line are scrolled off, in wrap mode
         """
-        for y, text in enumerate(self.content[line:]):
-            parsed = self.parse_line(text)
-            self.parsed_content[y] = parsed  # y = file line, not screen line
-            self.write_line(y + 1, text, index)  # y+1 to account for header
+        if line is not None:
+            self.top_line, self.top_row = line, top_row
+        line = self.top_line
+        if self.wrap and line < len(self.wrap_rows):  # It may have lost rows since
+            self.top_row = min(self.top_row, self.wrap_rows[line] - 1)
+        else:
+            self.top_row = 0
+        if self.suspend_render:
+            return
+        self.screen_lines = []
+        y = 1  # Row 0 is the header
+        while y < self.rows:
+            if line >= len(self.content):  # Past the end of the file
+                self.scr.addstr(y, 0, " " * (self.columns + self.gutter - 1))
+                y += 1
+                continue
+            if self.wrap:
+                y = self.write_wrapped(y, line, self.top_row if y == 1 else 0)
+                if line in self.folds:
+                    last = (self.wrap_rows[line] - 1) * self.wrap_width
+                    self.write_fold_marker(y - 1, line, last)
+            else:
+                self.screen_lines.append(line)
+                self.write_line(y, self.content[line], index)
+                if line in self.folds:
+                    self.write_fold_marker(y, line, index)
+                y += 1
+            line = self.next_line(line)
+
+        self.write_gutter()
+        self.move_cursor()
 
-            if y + 2 >= self.rows:
+    def write_wrapped(self, y: int, line: int, skip: int = 0) -> int:
+        """
+        Writes line over as many rows as it takes from row y, for wrap mode
+        skip is how many of its rows are scrolled off the top
+        Returns the row after it
+        """
+        content = self.content[line]
+        spans = self.highlight(content)
+        width = self.wrap_width
+        for index in range(skip * width, self.wrap_rows[line] * width, width):
+            if y >= self.rows:
                 break
+            self.screen_lines.append(line)
+            self.write_line(y, content, index, parse=spans, markers=False)
+            y += 1
+        return y
 
-        self.move_cursor()
+    def write_gutter(self) -> None:
+        """
+        Marks the visible lines that were added, changed or had lines deleted
+        since the last save, using the rows recorded by write_content
+        """
+        if not self.screen_lines or self.suspend_render:
+            return
+        marks = self.diff.marks(
+            self.screen_lines[0], self.screen_lines[-1] + 1, len(self.content)
+        )
+        colors = {Diff.ADDED: 4, Diff.MODIFIED: 7, Diff.DELETED: 6}
+        for y, line in enumerate(self.screen_lines, 1):
+            mark = marks.get(line)
+            if mark is None:
+                self.scr.addch(y, 0, " ")
+            else:
+                self.scr.addch(y, 0, mark, curses.color_pair(colors[mark]))
+
+    def write_fold_marker(self, y: int, line: int, index: int = 0) -> None:
+        """
+        Shows how many lines are folded away after the text of line
+        """
+        marker = " [+%d lines] " % (self.folds[line] - line)
+        shown = max(0, len(self.content[line]) - index)
+        x = min(shown + 1, self.columns - 3 - len(marker))
+        if x > 0:
+            self.scr.addstr(y, self.gutter + x, marker, curses.color_pair(1))
 
     def read_file(self, file: str) -> None:
         """
         Sets attributes to equal a new file, as indicated by a passed string
         """
-        # Move cursor to top left, both in file and window
-        self.cursor_y = 1
-        self.cursor_x, self.file_x, self.file_y = 0, 0, 0
         if self.file_object:  # Close any file that may be open
             self.file_object.close()
+            self.file_object = None
+        if self.stream and file != "-":  # Stop streaming the old file
+            self.stream.close()
+            self.stream = None
+        content = [""]
         try:
             # Update vars with new file
-            self.file_object = open(file)
-            self.content = self.file_object.read().split("\n")
-            self.original_content = [x for x in self.content]
+            if file != "-":  # "-" is piped in, and arrives through self.stream
+                self.file_object = open(file)
+                if self.follow:  # Read through the stream, so growth is picked up
+                    self.stream = Streams.StreamReader.follow(file)
+                else:
+                    content = self.file_object.read().split("\n")
         except FileNotFoundError:
-            # If no file is found, assume it will be created
-            self.content = [""]
-            self.original_content = [""]
+            pass  # If no file is found, assume it will be created
+        self.set_content(content)
         self.current_file = file
-        for line in range(len(self.content)):
-            # Pre-parse all the lines
-            self.parsed_content[line] = self.parse_line(self.content[line])
         self.clear_screen()
         self.write_header()
         self.write_content()
+        if self.stream:
+            self.poll_stream(limit=None)  # Everything that's already there
+
+    def set_content(self, content: list) -> None:
+        """
+        Replaces the whole buffer with content, which counts as unmodified
+        Moves the cursor to the top left and rebuilds the structure index
+        and the saved state changes are marked against
+        """
+        self.content = content
+        self.diff.reset(content)
+        self.cursor_y = 1
+        self.cursor_x, self.file_x, self.file_y = 0, 0, 0
+        self.top_line, self.top_row, self.scrolled_x, self.max_x = 0, 0, 0, 0
+        self.structure.reset(content)
+        self.folds, self.fold_ends, self.fold_starts = {}, {}, []
+        self.words = None
+        if self.wrap:
+            self.measure_wraps()
+
+    def poll_stream(self, limit: int = 1 << 20, budget: float = 0.05) -> None:
+        """
+        Appends whatever arrived on self.stream since the last poll
+        Reads limit bytes at a time until there's nothing left or budget seconds
+        have passed, then appends it all at once
+        """
+        chunks = []
+        deadline = time.perf_counter() + budget
+        while True:
+            text = self.stream.read(limit)
+            if self.stream.truncated:  # Followed file was cut short, show it afresh
+                self.stream.truncated = False
+                self.set_content([""])
+                self.write_content()
+                chunks = []
+            if not text:
+                break
+            chunks.append(text)
+            if time.perf_counter() > deadline:
+                break
+        self.stream_behind = bool(text)
+        if chunks:
+            self.append_text("".join(chunks))
+
+    def append_text(self, text: str) -> None:
+        """
+        Adds streamed text to the end of the file, it doesn't count as an edit
+        New lines are only parsed once they're drawn. The view follows the end
+        of the file unless the cursor has been moved off the last line
+        """
+        following = self.file_y == len(self.content) - 1
+        first_new = len(self.content) - 1  # The last line may have been partial
+        lines = text.split("\n")
+        self.content[-1] += lines[0]
+        self.content.extend(lines[1:])
+        self.lines_changed(first_new, 1, len(lines), edit=False)
+
+        if self.focus != "File":  # Don't draw under the box, catch up on close
+            self.repaint_pending = True
+            return
+        if following:
+            last = len(self.content) - 1
+            self.jump_to(last, row=self.rows - 1)
+        elif first_new < self.top_line + self.rows - 1:  # New text is on screen
+            self.write_content()
 
     def save_file(self) -> None:
-        self.file_object.close()  # Opened in read-only
+        if self.file_object:
+            self.file_object.close()  # Opened in read-only
         with open(self.current_file, "w") as f:
             f.write("\n".join(self.content))
+        if self.stream:  # Don't read our own writes back as appended text
+            self.stream.skip_to_end()
         # In the case of just saving, without closing
-        self.original_content = [x for x in self.content]
+        self.diff.reset(self.content)
         self.file_object = open(self.current_file)
+        self.write_gutter()  # Nothing is changed anymore
 
     def run(self) -> None:
         """
@@ -553,7 +1384,7 @@ class FileEditor:
         """
         try:
             self.running = True
-            self.rows, self.columns = self.scr.getmaxyx()
+            self.update_dimensions()
             curses.noecho()
             curses.cbreak()
             self.init_color()
@@ -580,11 +1411,30 @@ class FileEditor:
         curses.endwin()  # Not sure if this is needed
         if self.file_object:
             self.file_object.close()  # Don't save
+        if self.stream:
+            self.stream.close()
 
 
 if __name__ == "__main__":
-    try:
-        win = FileEditor(sys.argv[1])
-    except IndexError:
-        win = FileEditor()
+    parser = argparse.ArgumentParser(
+        description="Meda - A Python Command Line Text Editor"
+    )
+    parser.add_argument(
+        "file", nargs="?", default="", help="file to open, - to read from a pipe"
+    )
+    parser.add_argument(
+        "-f", "--follow", action="store_true", help="keep reading what gets appended"
+    )
+    parser.add_argument(
+        "--highlight-mb",
+        type=float,
+        default=32,
+        help="memory budget for cached syntax highlighting (default 32)",
+    )
+    args = parser.parse_args()
+    win = FileEditor(
+        args.file,
+        follow=args.follow,
+        highlight_budget=int(args.highlight_mb * 1024 * 1024),
+    )
     win.run()